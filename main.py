@@ -1,53 +1,103 @@
+import functools
+import logging
+
 import streamlit as st
-import pulp
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+
+# pulp and highspy are imported on first solve rather than here, so the
+# first page render only pays for streamlit, numpy & pandas (the sidebar grid).
+
+logger = logging.getLogger(__name__)
 
 ###############################################################################
 # CONSTANTS
 ###############################################################################
 EQUIP_LIFE_YEARS = 30  # years of depreciation for all equipment
 
+# Sidebar default values for each product (market price & slash carbon credit
+# differ per product, everything else shares the same starting point)
+PRODUCT_DEFAULTS = {
+    p: {
+        "market_price": mp,
+        "max_deliv_cost": 130.0,
+        "max_volume": 999999.0,
+        "slash_harvest_cost": 25.0,
+        "slash_transport_cost": 30.0,
+        "slash_wood_cost": 0.0,
+        "slash_carbon_credit": s_c,
+        "woodchips_harvest_cost": 20.0,
+        "woodchips_transport_cost": 25.0,
+        "woodchips_wood_cost": 0.0,
+        "woodchips_carbon_credit": 0.0,
+        "processing_cost": 10.0,
+        "capex_total": 0.0,
+    }
+    for p, mp, s_c in [
+        ("Biochar", 150.0, 15.0),
+        ("RNG", 180.0, 0.0),
+        ("eMethanol", 220.0, 0.0),
+    ]
+}
+
+# Per‑feedstock cost columns in params_df ("slash_harvest_cost", ...), in the
+# order of the last axis of the (feedstock, product, field) cost array
+COST_FIELDS = ("harvest_cost", "transport_cost", "wood_cost", "carbon_credit")
+
+# HiGHS model status name -> PuLP status name, so both solver paths report alike
+HIGHS_STATUS = {
+    "kOptimal": "Optimal",
+    "kInfeasible": "Infeasible",
+    "kUnbounded": "Unbounded",
+}
+
 ###############################################################################
 # SOLVER LOGIC
 ###############################################################################
 
+@functools.lru_cache(maxsize=None)
+def _get_highspy():
+    """Imports highspy on first use; None when it is not installed."""
+    try:
+        import highspy
+    except ImportError:  # fall back to PuLP + CBC
+        return None
+    return highspy
+
+
+@st.cache_resource
+def _highs_bases():
+    """
+    Last optimal HiGHS basis per LP shape, for warm starts.
+
+    Process‑wide rather than in st.session_state: it is used from inside the
+    cached solve_biomass_model, whose result must not depend on per‑session
+    state. st.cache_resource keeps the dict alive across script reruns, which
+    re‑execute this module.
+    """
+    return {}
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
 def solve_biomass_model(
         # Feedstock availability
         slash_avail,
         woodchips_avail,
         include_woodchips,
 
-        # The list of products to be optimized
-        selected_products,
-
-        # Maximum volume (capacity) for each product p
-        max_volume,
+        # One row per product to be optimized, one column per parameter:
+        #   market_price, max_deliv_cost, max_volume,
+        #   slash_harvest_cost, slash_transport_cost, slash_wood_cost, slash_carbon_credit,
+        #   woodchips_harvest_cost, woodchips_transport_cost, woodchips_wood_cost, woodchips_carbon_credit,
+        #   processing_cost, depreciation_per_ton
+        params_df,
 
-        # Per‑product variable & capital costs
-        processing_cost,
-        depreciation_per_ton,
-
-        # For each product p:
-        #   slash_harvest_cost[p], slash_transport_cost[p], slash_wood_cost[p], slash_carbon_credit[p]
-        #   woodchips_harvest_cost[p], woodchips_transport_cost[p], woodchips_wood_cost[p], woodchips_carbon_credit[p]
-        #   market_price[p], max_deliv_cost[p]
         # We also have a regulatory factor that inflates the compliance‑related portion of delivered cost
-        slash_harvest_cost,
-        slash_transport_cost,
-        slash_wood_cost,
-        slash_carbon_credit,
-        woodchips_harvest_cost,
-        woodchips_transport_cost,
-        woodchips_wood_cost,
-        woodchips_carbon_credit,
-        market_price,
-        max_deliv_cost,
         reg_factor
 ):
     """
     Builds a multi‑feedstock (Slash, Woodchips) × multi‑product model
-    for only the products in selected_products.
+    for only the products (rows) in params_df.
 
     DeliveredCost = (HarvestCost + TransportCost + WoodCost) × (1 + reg_factor)
                     + ProcessingCost + DepreciationCost.
@@ -57,141 +107,312 @@ def solve_biomass_model(
       status_str        : solver status (string, e.g. "Optimal")
       df_details        : DataFrame with allocated tons and financial details
       total_net_revenue : objective value (float)
+
+    Results are memoized on the inputs, so re‑running with unchanged settings
+    skips the solve entirely.
     """
 
     feedstocks = ["slash"]
     if include_woodchips:
         feedstocks.append("woodchips")
+    n_feed = len(feedstocks)
 
-    # Create the LP model
-    model = pulp.LpProblem("4FRI_MultiProduct_LightMode", sense=pulp.LpMaximize)
+    # -------------------- COEFFICIENTS --------------------
+    # Per‑product parameters as arrays (one entry per selected product)
+    products = params_df.index.to_numpy()
 
-    # Decision Variables: Q[(f, p)] in green tons
-    Q = {}
-    for p in selected_products:
-        for f in feedstocks:
-            Q[(f, p)] = pulp.LpVariable(f"Q_{f}_{p}", lowBound=0, cat=pulp.LpContinuous)
-
-    # OBJECTIVE: sum of net margin across all feedstock‑product combos
-    obj_terms = []
-    for p in selected_products:
-        for f in feedstocks:
-            # compliance‑sensitive cost = harvest + transport + wood
-            if f == "slash":
-                base_cost = (slash_harvest_cost[p] +
-                             slash_transport_cost[p] +
-                             slash_wood_cost[p])
-                carbon = slash_carbon_credit[p]
-            else:  # woodchips
-                base_cost = (woodchips_harvest_cost[p] +
-                             woodchips_transport_cost[p] +
-                             woodchips_wood_cost[p])
-                carbon = woodchips_carbon_credit[p]
-
-            delivered_cost = base_cost * (1 + reg_factor) \
-                             + processing_cost[p] + depreciation_per_ton[p]
-            revenue_per_ton = market_price[p] + carbon
-            net_margin = revenue_per_ton - delivered_cost
-
-            obj_terms.append(net_margin * Q[(f, p)])
-
-    model += pulp.lpSum(obj_terms), "Total_Net_Revenue"
+    def col(name):
+        return params_df[name].to_numpy(dtype=float)
 
-    # -------------------- CONSTRAINTS --------------------
-    # 1) Slash availability
-    model += pulp.lpSum(
-        [Q[("slash", p)] for p in selected_products if ("slash", p) in Q]
-    ) <= slash_avail, "SlashAvail"
+    price = col("market_price")
+    proc = col("processing_cost")
+    dep = col("depreciation_per_ton")
 
-    # 2) Woodchips availability
-    if include_woodchips:
-        model += pulp.lpSum(
-            [Q[("woodchips", p)] for p in selected_products if ("woodchips", p) in Q]
-        ) <= woodchips_avail, "WoodchipsAvail"
+    # cost_arr[fi, pi, :] = (harvest, transport, wood, carbon credit) in $/gt
+    cost_arr = np.stack([
+        params_df[[f"{f}_{field}" for field in COST_FIELDS]].to_numpy(dtype=float)
+        for f in feedstocks
+    ])
 
-    # 3) Max Delivered Cost constraints (per product p)
-    #    Σ(deliveredCost_tons) − max_deliv_cost[p] × Σ(tons) ≤ 0
-    for p in selected_products:
-        sum_cost_expr = []
-        sum_tons_expr = []
-        for f in feedstocks:
-            if (f, p) not in Q:
-                continue
-            if f == "slash":
-                base_cost = (slash_harvest_cost[p] +
-                             slash_transport_cost[p] +
-                             slash_wood_cost[p])
-            else:
-                base_cost = (woodchips_harvest_cost[p] +
-                             woodchips_transport_cost[p] +
-                             woodchips_wood_cost[p])
-
-            c_deliver = base_cost * (1 + reg_factor) + processing_cost[p] + depreciation_per_ton[p]
-            sum_cost_expr.append(c_deliver * Q[(f, p)])
-            sum_tons_expr.append(Q[(f, p)])
-
-        model += (
-            pulp.lpSum(sum_cost_expr) <= max_deliv_cost[p] * pulp.lpSum(sum_tons_expr)
-        ), f"MaxDeliveredCost_{p}"
-
-    # 4) Max Volume constraints: Σ_f Q[f, p] ≤ max_volume[p]
-    for p in selected_products:
-        model += pulp.lpSum(
-            [Q[(f, p)] for f in feedstocks if (f, p) in Q]
-        ) <= max_volume[p], f"MaxVolume_{p}"
+    # delivered[fi, pi] and net[fi, pi] in $/gt, computed once for every (f, p)
+    delivered, net = _compute_coeffs(cost_arr, price, proc, dep, float(reg_factor))
+    revenue = net + delivered
 
     # -------------------- SOLVE --------------------
+    avail = np.array([slash_avail, woodchips_avail][:n_feed], dtype=float)
+    mdc = col("max_deliv_cost")
+    mv = col("max_volume")
+
+    alloc = _solve_closed_form(delivered, net, avail, mdc, mv)
+    if alloc is not None:
+        status_str = "Optimal"
+        total_net_revenue = float((net * alloc).sum())
+    else:
+        solve_lp = _solve_lp_highs if _get_highspy() is not None else _solve_lp_pulp
+        status_str, alloc, total_net_revenue = solve_lp(
+            feedstocks, products, delivered, net, avail, mdc, mv
+        )
+
+    # -------------------- DETAIL TABLE --------------------
+    # (pi, fi) of every non‑zero allocation, product‑major like the table rows
+    pi, fi = np.nonzero(alloc.T >= 1e-6)
+    allocated = alloc[fi, pi]
+    delivered_per_ton = delivered[fi, pi]
+    revenue_per_ton = revenue[fi, pi]
+    net_per_ton = net[fi, pi]
+
+    df_details = pd.DataFrame({
+        "Product": products[pi],
+        "Feedstock": np.array(feedstocks)[fi],
+        "Allocated (green tons)": allocated,
+        "DeliveredCost ($/gt)": delivered_per_ton,
+        "Revenue ($/gt)": revenue_per_ton,
+        "Net Margin ($/gt)": net_per_ton,
+        "Processing Cost ($/gt)": proc[pi],
+        "Depreciation ($/gt)": dep[pi],
+        "Total DeliveredCost ($)": delivered_per_ton * allocated,
+        "Total Revenue ($)": revenue_per_ton * allocated,
+        "Total Net Margin ($)": net_per_ton * allocated,
+    })
+    return status_str, df_details, total_net_revenue
+
+
+def _compute_coeffs(cost_arr, price, proc, dep, reg_factor):
+    """
+    Delivered cost and net margin ($/gt) for every feedstock × product.
+
+    cost_arr has shape (|F|, |P|, 4), the last axis laid out as COST_FIELDS;
+    price, proc and dep are per‑product and broadcast across feedstocks.
+    """
+    # compliance‑sensitive cost = harvest + transport + wood
+    base = cost_arr[..., :3].sum(axis=-1)
+    delivered = base * (1 + reg_factor) + proc + dep
+    net = price + cost_arr[..., 3] - delivered
+    return delivered, net
+
+
+def _solve_closed_form(delivered, net, avail, mdc, mv, tol=1e-9):
+    """
+    Solves the allocation LP without a solver when its optimum is obvious.
+
+    Dropping the MaxDeliveredCost and MaxVolume rows leaves one independent
+    problem per feedstock: send all of it to the product with the highest
+    positive net margin. That allocation bounds the full LP from above, so if
+    it also satisfies the dropped rows it is optimal. Products whose delivered
+    cost exceeds max_deliv_cost for every feedstock can never be used and are
+    left out of the bound up front.
+
+    Returns:
+      alloc : allocated green tons, shape (|F|, |P|), or None when the bound
+              violates a dropped row and the LP has to be solved
+    """
+    n_feed, n_prod = net.shape
+    usable = (delivered <= mdc).any(axis=0)
+    margin = np.where(usable, net, -np.inf)
+
+    alloc = np.zeros((n_feed, n_prod))
+    best = margin.argmax(axis=1)
+    rows = np.arange(n_feed)
+    take = margin[rows, best] > 0
+    alloc[rows[take], best[take]] = avail[take]
+
+    if (alloc.sum(axis=0) > mv + tol).any():
+        return None
+    if (((delivered - mdc) * alloc).sum(axis=0) > tol).any():
+        return None
+    return alloc
+
+
+def _needed_rows(delivered, avail, mdc, mv):
+    """
+    Works out which MaxDeliveredCost / MaxVolume rows can change the optimum.
+
+    MaxDeliveredCost_p is redundant when every feedstock's delivered cost is
+    within max_deliv_cost[p]. When every feedstock is over the limit the row
+    just forces the product to zero, which is expressed as a column upper bound
+    of 0 instead. MaxVolume_p is redundant when max_volume[p] covers the total
+    availability. With a single feedstock no MaxDeliveredCost row is left.
+
+    Returns:
+      mdc_rows : bool per product, keep MaxDeliveredCost_p
+      mv_rows  : bool per product, keep MaxVolume_p
+      blocked  : bool per product, fix all of its Q[f, p] to 0
+    """
+    within = delivered <= mdc
+    blocked = ~within.any(axis=0)
+    mdc_rows = ~within.all(axis=0) & ~blocked
+    mv_rows = mv < avail.sum()
+
+    n_skipped = 2 * len(mdc) - mdc_rows.sum() - mv_rows.sum()
+    logger.debug("Skipped %d redundant MaxDeliveredCost/MaxVolume rows", n_skipped)
+    return mdc_rows, mv_rows, blocked
+
+
+def _solve_lp_highs(feedstocks, products, delivered, net, avail, mdc, mv):
+    """
+    Solves the allocation LP in‑process with HiGHS.
+
+    Columns are Q[f, p] in feedstock‑major order (j = fi * |P| + pi); rows are
+    the feedstock availabilities, then MaxDeliveredCost_p, then MaxVolume_p for
+    the products whose rows are not redundant (see _needed_rows). The
+    constraint matrix is passed directly in compressed‑column form.
+
+    Returns:
+      status_str        : solver status, using PuLP's status names
+      alloc             : allocated green tons, shape (|F|, |P|)
+      total_net_revenue : objective value (float)
+    """
+    highspy = _get_highspy()
+    mdc_rows, mv_rows, blocked = _needed_rows(delivered, avail, mdc, mv)
+    n_feed, n_prod = len(feedstocks), len(products)
+    n_col = n_feed * n_prod
+    fi, pi = np.divmod(np.arange(n_col), n_prod)
+
+    # Dense rows (tiny: at most |F| + 2|P|), then packed column by column
+    A = np.vstack([
+        fi == np.arange(n_feed)[:, None],                                         # availability
+        (pi == np.flatnonzero(mdc_rows)[:, None]) * (delivered - mdc).ravel(),    # MaxDeliveredCost_p
+        pi == np.flatnonzero(mv_rows)[:, None],                                   # MaxVolume_p
+    ]).astype(float)
+    n_row = A.shape[0]
+    col_idx, row_idx = np.nonzero(A.T)
+
+    lp = highspy.HighsLp()
+    lp.num_col_ = n_col
+    lp.num_row_ = n_row
+    lp.sense_ = highspy.ObjSense.kMaximize
+    lp.col_cost_ = net.ravel()
+    lp.col_lower_ = np.zeros(n_col)
+    lp.col_upper_ = np.where(blocked[pi], 0.0, highspy.kHighsInf)
+    lp.row_lower_ = np.full(n_row, -highspy.kHighsInf)
+    lp.row_upper_ = np.concatenate([avail, np.zeros(mdc_rows.sum()), mv[mv_rows]])
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = np.searchsorted(col_idx, np.arange(n_col + 1))
+    lp.a_matrix_.index_ = row_idx
+    lp.a_matrix_.value_ = A[row_idx, col_idx]
+
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    h.passModel(lp)
+
+    # Warm start from the last optimal basis of an LP with the same rows &
+    # columns; only costs and bounds moved, so a few pivots usually do.
+    shape = (tuple(feedstocks), tuple(products), tuple(mdc_rows), tuple(mv_rows))
+    bases = _highs_bases()
+    if shape in bases:
+        h.setBasis(bases[shape])
+    h.run()
+
+    model_status = h.getModelStatus()
+    status_str = HIGHS_STATUS.get(model_status.name, "Not Solved")
+    if status_str != "Optimal":
+        return status_str, np.zeros((n_feed, n_prod)), 0.0
+
+    bases[shape] = h.getBasis()
+    alloc = np.array(h.getSolution().col_value).reshape(n_feed, n_prod)
+    return status_str, alloc, h.getInfo().objective_function_value
+
+
+def _solve_lp_pulp(feedstocks, products, delivered, net, avail, mdc, mv):
+    """
+    Fallback for _solve_lp_highs when highspy is not installed: builds the same
+    LP with PuLP and solves it with the bundled CBC binary.
+    """
+    import pulp
+
+    mdc_rows, mv_rows, blocked = _needed_rows(delivered, avail, mdc, mv)
+
+    # Create the LP model column‑wise: every row is declared up front as an
+    # (initially empty) LpConstraintVar and each Q[f, p] column then lists its
+    # coefficient in the objective and in every row it touches.
+    model = pulp.LpProblem("4FRI_MultiProduct_LightMode", sense=pulp.LpMaximize)
+    obj = pulp.LpConstraintVar("Total_Net_Revenue")
+    model.setObjective(obj)
+
+    # -------------------- CONSTRAINTS --------------------
+    # Each row is added to the model as it is declared; the per‑product rows
+    # share a single pass over the products.
+    # 1) Slash availability / 2) Woodchips availability
+    avail_name = {"slash": "SlashAvail", "woodchips": "WoodchipsAvail"}
+    avail_cv = []
+    for fi, f in enumerate(feedstocks):
+        avail_cv.append(pulp.LpConstraintVar(avail_name[f], pulp.LpConstraintLE, avail[fi]))
+        model += avail_cv[fi]
+
+    # 3) Max Delivered Cost constraints (per product p, only where not redundant)
+    #    Σ(deliveredCost_tons) − max_deliv_cost[p] × Σ(tons) ≤ 0
+    # 4) Max Volume constraints: Σ_f Q[f, p] ≤ max_volume[p] (only where binding)
+    mdc_cv, mv_cv = {}, {}
+    for pi, p in enumerate(products):
+        if mdc_rows[pi]:
+            mdc_cv[pi] = pulp.LpConstraintVar(f"MaxDeliveredCost_{p}", pulp.LpConstraintLE, 0)
+            model += mdc_cv[pi]
+        if mv_rows[pi]:
+            mv_cv[pi] = pulp.LpConstraintVar(f"MaxVolume_{p}", pulp.LpConstraintLE, mv[pi])
+            model += mv_cv[pi]
+
+    # Decision Variables: Qmat[fi][pi] in green tons. Each column expression is
+    # built in one go from (row, coefficient) pairs rather than by chaining "+",
+    # which would copy the partial expression at every step.
+    Qmat = []
+    for fi, f in enumerate(feedstocks):
+        row = []
+        for pi, p in enumerate(products):
+            terms = [(obj, net[fi, pi]), (avail_cv[fi], 1)]
+            if pi in mdc_cv:
+                terms.append((mdc_cv[pi], delivered[fi, pi] - mdc[pi]))
+            if pi in mv_cv:
+                terms.append((mv_cv[pi], 1))
+            row.append(pulp.LpVariable(
+                f"Q_{f}_{p}", lowBound=0, upBound=0 if blocked[pi] else None,
+                cat=pulp.LpContinuous, e=pulp.LpAffineExpression(terms)))
+        Qmat.append(row)
+
     status = model.solve(pulp.PULP_CBC_CMD(msg=0))
     status_str = pulp.LpStatus[status]
     total_net_revenue = pulp.value(model.objective) if model.objective else 0.0
 
-    # -------------------- DETAIL TABLE --------------------
-    rows = []
-    for p in selected_products:
-        for f in feedstocks:
-            if (f, p) not in Q:
-                continue
-            allocated = Q[(f, p)].varValue or 0.0
-            if allocated < 1e-6:
-                continue
-
-            # Recompute delivered cost & revenue details for each row
-            if f == "slash":
-                base_cost = (slash_harvest_cost[p] +
-                             slash_transport_cost[p] +
-                             slash_wood_cost[p])
-                carbon = slash_carbon_credit[p]
-            else:
-                base_cost = (woodchips_harvest_cost[p] +
-                             woodchips_transport_cost[p] +
-                             woodchips_wood_cost[p])
-                carbon = woodchips_carbon_credit[p]
-
-            delivered_cost_per_ton = base_cost * (1 + reg_factor) + processing_cost[p] + depreciation_per_ton[p]
-            revenue_per_ton = market_price[p] + carbon
-            net_margin_per_ton = revenue_per_ton - delivered_cost_per_ton
-
-            rows.append({
-                "Product": p,
-                "Feedstock": f,
-                "Allocated (green tons)": round(allocated, 2),
-                "DeliveredCost ($/gt)": round(delivered_cost_per_ton, 2),
-                "Revenue ($/gt)": round(revenue_per_ton, 2),
-                "Net Margin ($/gt)": round(net_margin_per_ton, 2),
-                "Processing Cost ($/gt)": round(processing_cost[p], 2),
-                "Depreciation ($/gt)": round(depreciation_per_ton[p], 2),
-                "Total DeliveredCost ($)": round(delivered_cost_per_ton * allocated, 2),
-                "Total Revenue ($)": round(revenue_per_ton * allocated, 2),
-                "Total Net Margin ($)": round(net_margin_per_ton * allocated, 2)
-            })
+    alloc = np.array([[q.varValue or 0.0 for q in row] for row in Qmat])
+    return status_str, alloc, total_net_revenue
 
-    df_details = pd.DataFrame(rows)
-    return status_str, df_details, total_net_revenue
 
 ###############################################################################
 # STREAMLIT APP (LIGHT MODE) - MAIN
 ###############################################################################
 
+@st.fragment
+def product_settings():
+    """
+    Sidebar products × parameters grid, seeded from PRODUCT_DEFAULTS.
+
+    Runs as a fragment: editing a cell reruns only this function, not the whole
+    script. The edits live in the keyed widget state, so the full rerun
+    triggered by Run Optimization picks them up.
+    """
+    if "params_defaults" not in st.session_state:
+        st.session_state["params_defaults"] = pd.DataFrame.from_dict(PRODUCT_DEFAULTS, orient="index")
+    return st.data_editor(
+        st.session_state["params_defaults"],
+        key="params",
+        num_rows="fixed",
+        column_config={
+            "market_price": st.column_config.NumberColumn("Market Price [$/gt]", min_value=0.0, required=True),
+            "max_deliv_cost": st.column_config.NumberColumn("Max Delivered Cost [$/gt]", min_value=0.0, required=True),
+            "max_volume": st.column_config.NumberColumn("Max Volume (green tons)", min_value=1.0, required=True),
+            "slash_harvest_cost": st.column_config.NumberColumn("Slash Harvest [$/gt]", min_value=0.0, required=True),
+            "slash_transport_cost": st.column_config.NumberColumn("Slash Transport [$/gt]", min_value=0.0, required=True),
+            "slash_wood_cost": st.column_config.NumberColumn("Slash Wood Cost [$/gt]", min_value=0.0, required=True),
+            "slash_carbon_credit": st.column_config.NumberColumn("Slash CarbonCredit [$/gt]", min_value=0.0, required=True),
+            "woodchips_harvest_cost": st.column_config.NumberColumn("Woodchips Harvest [$/gt]", min_value=0.0, required=True),
+            "woodchips_transport_cost": st.column_config.NumberColumn("Woodchips Transport [$/gt]", min_value=0.0, required=True),
+            "woodchips_wood_cost": st.column_config.NumberColumn("Woodchips Wood Cost [$/gt]", min_value=0.0, required=True),
+            "woodchips_carbon_credit": st.column_config.NumberColumn("Woodchips CarbonCredit [$/gt]", min_value=0.0, required=True),
+            "processing_cost": st.column_config.NumberColumn("Processing OPEX [$/gt]", min_value=0.0, required=True),
+            "capex_total": st.column_config.NumberColumn("Total CAPEX [$]", min_value=0.0, step=1000.0, required=True),
+        },
+    )
+
+
 def main():
     # Page config
     st.set_page_config(page_title="Biomass Optimization (Light Mode)", layout="wide")
@@ -212,21 +433,24 @@ def main():
 
     # -------------------- SIDEBAR --------------------
     st.sidebar.header("Feedstock Availability")
-    slash_avail = st.sidebar.number_input("Slash Availability (green tons)", value=20000.0, min_value=0.0)
+    slash_avail = st.sidebar.number_input("Slash Availability (green tons)", value=20000.0, min_value=0.0,
+                                          key="slash_avail")
 
-    include_woodchips = st.sidebar.checkbox("Include Woodchips?", value=True)
+    include_woodchips = st.sidebar.checkbox("Include Woodchips?", value=True, key="include_woodchips")
     woodchips_avail = 0.0
     if include_woodchips:
-        woodchips_avail = st.sidebar.number_input("Woodchips Availability (green tons)", value=15000.0, min_value=0.0)
+        woodchips_avail = st.sidebar.number_input("Woodchips Availability (green tons)", value=15000.0, min_value=0.0,
+                                                  key="woodchips_avail")
 
     # Regulatory Factor – cost of compliance multiplier
-    reg_factor = st.sidebar.slider("Regulatory Factor (cost‑of‑compliance multiplier)", 0.0, 1.0, 0.2, 0.01)
+    reg_factor = st.sidebar.slider("Regulatory Factor (cost‑of‑compliance multiplier)", 0.0, 1.0, 0.2, 0.01,
+                                   key="reg_factor")
 
     st.sidebar.header("Products to Optimize")
-    all_products = ["Biochar", "RNG", "eMethanol"]
+    all_products = list(PRODUCT_DEFAULTS)
     selected_products = []
     for p in all_products:
-        use_p = st.sidebar.checkbox(f"Use {p}?", value=True)
+        use_p = st.sidebar.checkbox(f"Use {p}?", value=True, key=f"use_{p}")
         if use_p:
             selected_products.append(p)
 
@@ -235,76 +459,20 @@ def main():
         return
 
     # -------------------- COLLECT COST PARAMETERS --------------------
-    slash_harvest_cost = {}
-    slash_transport_cost = {}
-    slash_wood_cost = {}
-    slash_carbon_credit = {}
-
-    woodchips_harvest_cost = {}
-    woodchips_transport_cost = {}
-    woodchips_wood_cost = {}
-    woodchips_carbon_credit = {}
-
-    market_price = {}
-    max_deliv_cost = {}
-    max_volume = {}
-
-    processing_cost = {}
-    capex_total = {}
-    depreciation_per_ton = {}
-
-    for p in selected_products:
-        with st.sidebar.expander(f"{p} Settings"):
-            # ---------------- MARKET ----------------
-            mp = st.number_input(f"{p} Market Price [$/gt]",
-                                 value=150.0 if p == "Biochar" else (180.0 if p == "RNG" else 220.0),
-                                 min_value=0.0)
-            market_price[p] = mp
-
-            # ---------------- CONSTRAINTS ----------------
-            mdc = st.number_input(f"{p} Max Delivered Cost [$/gt]", value=130.0, min_value=0.0)
-            max_deliv_cost[p] = mdc
-
-            mv = st.number_input(f"{p} Max Volume (green tons)", value=999999.0, min_value=1.0)
-            max_volume[p] = mv
-
-            # ---------------- SLASH COSTS ----------------
-            st.write(f"**Slash → {p}**")
-            s_h = st.number_input(f"Slash Harvest: {p} [$/gt]", value=25.0, min_value=0.0)
-            s_t = st.number_input(f"Slash Transport: {p} [$/gt]", value=30.0, min_value=0.0)
-            s_w = st.number_input(f"Slash Wood Cost: {p} [$/gt]", value=0.0, min_value=0.0)
-            s_c = st.number_input(f"Slash CarbonCredit: {p} [$/gt]", value=15.0 if p == "Biochar" else 0.0, min_value=0.0)
-
-            slash_harvest_cost[p] = s_h
-            slash_transport_cost[p] = s_t
-            slash_wood_cost[p] = s_w
-            slash_carbon_credit[p] = s_c
-
-            # ---------------- WOODCHIPS COSTS ----------------
-            st.write(f"**Woodchips → {p}**")
-            w_h = st.number_input(f"Woodchips Harvest: {p} [$/gt]", value=20.0, min_value=0.0)
-            w_t = st.number_input(f"Woodchips Transport: {p} [$/gt]", value=25.0, min_value=0.0)
-            w_w = st.number_input(f"Woodchips Wood Cost: {p} [$/gt]", value=0.0, min_value=0.0)
-            w_c = st.number_input(f"Woodchips CarbonCredit: {p} [$/gt]", value=0.0, min_value=0.0)
-
-            woodchips_harvest_cost[p] = w_h
-            woodchips_transport_cost[p] = w_t
-            woodchips_wood_cost[p] = w_w
-            woodchips_carbon_credit[p] = w_c
-
-            # ---------------- PROCESSING & CAPEX ----------------
-            st.markdown("---")
-            pc = st.number_input(f"Processing OPEX: {p} [$/gt]", value=10.0, min_value=0.0)
-            processing_cost[p] = pc
-
-            cap = st.number_input(f"Total CAPEX for {p} [$]", value=0.0, min_value=0.0, step=1000.0)
-            capex_total[p] = cap
-
-            # Compute straight‑line depreciation per ton using max_volume as expected annual capacity
-            if mv > 0:
-                depreciation_per_ton[p] = cap / EQUIP_LIFE_YEARS / mv
-            else:
-                depreciation_per_ton[p] = 0.0
+    # One editable products × parameters grid instead of a number_input per cell.
+    # All products stay in the grid so edits keep their row when the selection
+    # changes; only the selected rows are passed to the solver.
+    st.sidebar.header("Product Settings")
+    with st.sidebar:
+        edited = product_settings()
+    # Any cell left empty falls back to its default rather than reaching the
+    # solver as NaN (which would yield a NaN objective or drop constraints)
+    params_df = edited.loc[selected_products].fillna(st.session_state["params_defaults"])
+
+    # Straight‑line depreciation per ton using max_volume as expected annual capacity
+    params_df = params_df.assign(depreciation_per_ton=(
+        params_df["capex_total"] / EQUIP_LIFE_YEARS / params_df["max_volume"]
+    ).where(params_df["max_volume"] > 0, 0.0))
 
     # -------------------- RUN OPTIMIZATION --------------------
     if st.sidebar.button("Run Optimization"):
@@ -312,20 +480,7 @@ def main():
             slash_avail,
             woodchips_avail,
             include_woodchips,
-            selected_products,
-            max_volume,
-            processing_cost,
-            depreciation_per_ton,
-            slash_harvest_cost,
-            slash_transport_cost,
-            slash_wood_cost,
-            slash_carbon_credit,
-            woodchips_harvest_cost,
-            woodchips_transport_cost,
-            woodchips_wood_cost,
-            woodchips_carbon_credit,
-            market_price,
-            max_deliv_cost,
+            params_df,
             reg_factor
         )
 
@@ -338,26 +493,16 @@ def main():
             st.warning("No biomass allocated (all zero). Possibly your costs are too high or constraints too strict.")
         else:
             st.write("**Allocation & Financial Details** (non‑zero green tons):")
-            st.dataframe(df_details.style.format({
-                "Allocated (green tons)": "{:.2f}",
-                "DeliveredCost ($/gt)": "{:.2f}",
-                "Revenue ($/gt)": "{:.2f}",
-                "Net Margin ($/gt)": "{:.2f}",
-                "Processing Cost ($/gt)": "{:.2f}",
-                "Depreciation ($/gt)": "{:.2f}",
-                "Total DeliveredCost ($)": "{:.2f}",
-                "Total Revenue ($)": "{:.2f}",
-                "Total Net Margin ($)": "{:.2f}"
-            }))
+            # Two‑decimal display is applied in the browser via column_config
+            st.dataframe(df_details, column_config={
+                col: st.column_config.NumberColumn(format="%.2f")
+                for col in df_details.columns.drop(["Product", "Feedstock"])
+            })
 
             # Bar chart – allocation by product & feedstock
             pivoted = df_details.pivot(index="Product", columns="Feedstock", values="Allocated (green tons)").fillna(0)
-            fig, ax = plt.subplots()
-            pivoted.plot(kind="bar", ax=ax)
-            ax.set_title("Optimal Allocation (green tons)")
-            ax.set_xlabel("Product")
-            ax.set_ylabel("Green Tons")
-            st.pyplot(fig)
+            st.write("**Optimal Allocation (green tons)**")
+            st.bar_chart(pivoted, x_label="Product", y_label="Green Tons", stack=False)
 
     # -------------------- LEGEND --------------------
     st.markdown("---")